@@ -1,12 +1,11 @@
+import logging
 import streamlit as st
 import requests
-from bs4 import BeautifulSoup
-from datetime import datetime
+from requests.adapters import HTTPAdapter
+from lxml import etree, html as lh
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-import plotly.graph_objects as go
 
 BASE_URL = "http://www.geophysics.geol.uoa.gr/stations/maps/"
 DATA_URLS = {
@@ -15,77 +14,178 @@ DATA_URLS = {
     "Last 20 Days": "recent_eq_20d_el.htm"
 }
 
-@st.cache_data(show_spinner=False)
+logger = logging.getLogger(__name__)
+
+@st.cache_resource
+def get_session():
+    """Shared session so repeated fetches reuse the keep-alive connection to the host."""
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    return session
+
+@st.cache_resource
+def _validated_pages():
+    """Last processed DataFrame per URL, with the validators to send when re-fetching it."""
+    return {}
+
+@st.cache_resource
+def _compression_checked_urls():
+    """URLs whose response compression has already been checked."""
+    return set()
+
 def fetch_data(time_range):
+    """
+    Fetch the seismic data for the given time range, reporting any error to the user.
+    Returns the DataFrame, or None if it could not be loaded.
+    """
+    df, error = _cached_data(time_range)
+    if error:
+        st.error(error)
+    return df
+
+def _cached_data(time_range):
+    """
+    Look up the (DataFrame, error) pair for the given time range in a TTL cache.
+    The most recent range is refreshed more often since freshness matters most there.
+    """
+    if time_range == "Last 2 Days":
+        return _fetch_recent_data(time_range)
+    return _fetch_archived_data(time_range)
+
+@st.cache_data(show_spinner=False, ttl=120, max_entries=1)
+def _fetch_recent_data(time_range):
+    return _load_data(time_range)
+
+@st.cache_data(show_spinner=False, ttl=300, max_entries=2)
+def _fetch_archived_data(time_range):
+    return _load_data(time_range)
+
+def _load_data(time_range):
     """
     Fetch and process the seismic data for the given time range.
-    Returns a DataFrame filtered for the Santorini area and shallow earthquakes.
+    Returns a DataFrame filtered for the Santorini area and shallow earthquakes, paired with
+    an error message instead when the data cannot be loaded. Errors are returned rather than
+    shown here because this also runs on prefetch threads, where st.error is not displayed.
     """
     url = BASE_URL + DATA_URLS[time_range]
+    previous = _validated_pages().get(url)
 
     try:
-        response = requests.get(url)
+        response = get_session().get(url, headers=previous[0] if previous else None, timeout=(3, 10))
         response.raise_for_status()
         response.encoding = 'iso-8859-7'
     except requests.RequestException as e:
-        st.error(f"Error fetching data: {e}")
-        return None
+        return None, f"Error fetching data: {e}"
 
-    soup = BeautifulSoup(response.text, 'html.parser')
-    tables = soup.find_all('table')
-    if len(tables) < 3:
-        st.error("Insufficient tables found on the page.")
-        return None
+    if response.status_code == 304 and previous:
+        return previous[1], None
 
-    table = tables[2]
+    # requests asks for gzip/deflate by default; flag it once per URL if the server ignores that
+    checked_urls = _compression_checked_urls()
+    if url not in checked_urls:
+        checked_urls.add(url)
+        if 'Content-Encoding' not in response.headers:
+            logger.warning("%s was served without compression", url)
+
+    try:
+        # Parse UTF-8 bytes with an explicit encoding so an XML encoding declaration in the page is not rejected
+        root = lh.fromstring(response.text.encode('utf-8'), parser=lh.HTMLParser(encoding='utf-8'))
+    except etree.ParserError:
+        root = None  # Empty document
+    if root is None or root.xpath('count(//table)') < 3:
+        return None, "Insufficient tables found on the page."
+
+    # Walk only the rows of the third table, skipping its header row
     data = []
-    for row in table.find_all('tr')[1:]:
-        row_data = [td.get_text(strip=True) for td in row.find_all('td')]
+    for row in root.xpath('((//table)[3]//tr)[position() > 1]'):
+        row_data = [td.text_content().strip() for td in row.xpath('./td')]
         if row_data:
             data.append(row_data)
 
     if not data:
-        st.error("No data found in the extracted table.")
-        return None
+        return None, "No data found in the extracted table."
 
     expected_columns = ["Origin Time (GMT)", "Epicenter", "Latitude", "Longitude", "Depth (km)", "Magnitude"]
-    df = pd.DataFrame([row[2:] for row in data], columns=expected_columns)
-    df = df.iloc[:, :len(expected_columns)]  # Trim to expected columns
+    df = pd.DataFrame(data).iloc[:, 2:2 + len(expected_columns)]  # Trim to expected columns
 
     if df.shape[1] != len(expected_columns):
-        st.error(f"Unexpected table format. Expected {len(expected_columns)} columns, got {df.shape[1]}.")
-        return None
+        return None, f"Unexpected table format. Expected {len(expected_columns)} columns, got {df.shape[1]}."
 
     df.columns = expected_columns
-    df = df[df['Epicenter'].str.contains('Θήρας', na=False)]
-    df = df[pd.to_numeric(df['Depth (km)'], errors='coerce') < 100]
+    # Parse columns once here, into compact dtypes, so the cached frame is ready for filtering and plotting
+    df = df.assign(
+        **{
+            column: pd.to_numeric(df[column], errors='coerce', downcast='float')
+            for column in ['Latitude', 'Longitude', 'Depth (km)', 'Magnitude']
+        },
+        Epicenter=df['Epicenter'].astype('string[pyarrow]'),
+    )
 
-    return df
+    # Arrow's string kernel scans the whole column for the literal in one call
+    in_santorini = df['Epicenter'].str.contains('Θήρας', regex=False, na=False)
+    df = df.loc[in_santorini & (df['Depth (km)'] < 100) & df['Magnitude'].notna()].copy()
 
-def generate_plot(df, time_range):
-    """Generate a Matplotlib plot and convert it into an interactive Plotly figure."""
     try:
-        time = np.array([datetime.strptime(ts, '%d/%m/%Y %H:%M:%S') for ts in df['Origin Time (GMT)']])
-        magnitude = df['Magnitude'].astype(float)
-    except Exception as e:
-        st.error(f"Error processing data: {e}")
-        return None
-
-    coefficients = np.polyfit(range(len(time)), magnitude, 2)
-    quadratic_trend = np.poly1d(coefficients)(range(len(time)))
-
-    # Create Matplotlib figure (for reference)
-    fig, ax = plt.subplots(figsize=(10, 6))
-    ax.plot(time, magnitude, marker='o', linestyle='-', label='Magnitude', color='blue')
-    ax.plot(time, quadratic_trend, linestyle='--', color='red', label='Quadratic Trend')
-    ax.set_xlabel('Date')
-    ax.set_ylabel('Magnitude')
-    ax.set_title(f'Seismic Activity near Santorini - {time_range}')
-    ax.xaxis.set_major_formatter(mdates.DateFormatter('%d/%m %H:%M' if time_range == "Last 2 Days" else '%d/%m'))
-    plt.legend(loc='upper left')
-    plt.tight_layout()
-
-    # Convert to Plotly for interactivity
+        df['Time'] = pd.to_datetime(df['Origin Time (GMT)'], format='%d/%m/%Y %H:%M:%S', exact=True, cache=True)
+    except ValueError as e:
+        return None, f"Error processing data: {e}"
+
+    # Remember the page validators so an unchanged page is answered with 304 Not Modified
+    validators = {}
+    if 'ETag' in response.headers:
+        validators['If-None-Match'] = response.headers['ETag']
+    if 'Last-Modified' in response.headers:
+        validators['If-Modified-Since'] = response.headers['Last-Modified']
+    if validators:
+        _validated_pages()[url] = (validators, df)
+
+    return df, None
+
+@st.cache_resource(show_spinner=False)
+def prefetch_data():
+    """Warm the cold data cache for every time range concurrently, once per server process."""
+    executor = ThreadPoolExecutor(max_workers=len(DATA_URLS))
+    for time_range in DATA_URLS:
+        executor.submit(_cached_data, time_range)
+    executor.shutdown(wait=False)
+
+def fit_quadratic_trend(values):
+    """
+    Least-squares quadratic trend of evenly spaced samples, evaluated at each sample.
+    The sample index is scaled to [0, 1] so the 3x3 normal equations have closed-form sums.
+    """
+    y = np.asarray(values, dtype=float)
+    n = len(y)
+    m = max(n - 1, 1)
+    t = np.arange(n) / m
+
+    # Sums of k^p for k = 0..n-1, divided by m^p
+    s1 = (n - 1) * n / 2 / m
+    s2 = (n - 1) * n * (2 * n - 1) / 6 / m**2
+    s3 = ((n - 1) * n / 2) ** 2 / m**3
+    s4 = (n - 1) * n * (2 * n - 1) * (3 * (n - 1) ** 2 + 3 * (n - 1) - 1) / 30 / m**4
+
+    normal = np.array([[s4, s3, s2], [s3, s2, s1], [s2, s1, n]])
+    rhs = np.array([np.dot(t * t, y), np.dot(t, y), y.sum()])
+    # lstsq rather than solve so fewer than three samples still yield a fit, as with np.polyfit
+    coefficients = np.linalg.lstsq(normal, rhs, rcond=None)[0]
+    return np.polyval(coefficients, t)
+
+@st.cache_data(show_spinner=False, ttl=300, max_entries=6)
+def generate_plot(df, time_range):
+    """
+    Generate an interactive Plotly figure of magnitude over time with its quadratic trend.
+    Returns the figure as a dict spec, which unpickles from the cache without rerunning Plotly's validators.
+    """
+    # Imported here so the selection page renders without loading Plotly
+    import plotly.graph_objects as go
+
+    time = df['Time'].values
+    magnitude = df['Magnitude']
+
+    quadratic_trend = fit_quadratic_trend(magnitude)
+
     plotly_fig = go.Figure()
 
     # Main magnitude line with hover tooltips
@@ -94,7 +194,7 @@ def generate_plot(df, time_range):
         name='Magnitude',
         line=dict(color='blue'),
         marker=dict(size=6),
-        hovertemplate="<b>Magnitude:</b> %{y}<br><b>Time:</b> %{x}<extra></extra>"
+        hovertemplate="<b>Magnitude:</b> %{y:.1f}<br><b>Time:</b> %{x}<extra></extra>"
     ))
 
     # Quadratic trend line
@@ -115,7 +215,7 @@ def generate_plot(df, time_range):
         autosize=True
     )
 
-    return plotly_fig
+    return plotly_fig.to_dict()
 
 def main():
     st.title("Santorini Seismic Activity Dashboard")
@@ -124,26 +224,38 @@ def main():
     if "selected_time_range" not in st.session_state:
         st.session_state.selected_time_range = None
 
+    prefetch_data()
+
     if st.session_state.selected_time_range:
         # Fullscreen Mode
         time_range = st.session_state.selected_time_range
-        df = fetch_data(time_range)
-
-        if df is not None and not df.empty:
-            fig = generate_plot(df, time_range)
-            if fig:
-                st.plotly_chart(fig, use_container_width=True, config={
-                    "displayModeBar": True,
-                    "modeBarButtonsToRemove": [
-                        "zoom2d", "select2d", "lasso2d", "autoScale2d", 
-                        "hoverClosestCartesian", "hoverCompareCartesian", 
-                        "resetScale2d", "toImage"
-                    ],
-                    "displaylogo": False
-                })
+
+        # Keep the built go.Figure for this session so reruns in fullscreen mode skip fetching and plotting
+        fig_key = f"fig_{time_range}"
+        if fig_key not in st.session_state:
+            df = fetch_data(time_range)
+            if df is not None and not df.empty:
+                import plotly.graph_objects as go
+
+                # The spec was validated when generate_plot built it
+                st.session_state[fig_key] = go.Figure(generate_plot(df, time_range), _validate=False)
+
+        fig = st.session_state.get(fig_key)
+        if fig is not None:
+            st.plotly_chart(fig, use_container_width=True, config={
+                "displayModeBar": True,
+                "modeBarButtonsToRemove": [
+                    "zoom2d", "select2d", "lasso2d", "autoScale2d", 
+                    "hoverClosestCartesian", "hoverCompareCartesian", 
+                    "resetScale2d", "toImage"
+                ],
+                "displaylogo": False
+            })
 
         # Back button to return to the main selection page
         if st.button("Back to Selection"):
+            # Drop the figure so the next visit picks up data refreshed by the cache TTL
+            st.session_state.pop(fig_key, None)
             st.session_state.selected_time_range = None
             st.rerun()
     else: